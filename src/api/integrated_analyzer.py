@@ -12,8 +12,10 @@ except ImportError:
 
 try:
     from src.ml.url_extractor import SimpleURLExtractor
+    default_url_extractor = None
 except ImportError:
     from src.ml.url_extractor import URLExtractor as SimpleURLExtractor
+    from src.ml.url_extractor import default_extractor as default_url_extractor
 
 # Conditionally import advanced components
 try:
@@ -52,7 +54,7 @@ class IntegratedAnalyzer:
     def __init__(self):
         # Always available basic analyzers
         self.behavioral_analyzer = SimpleBehavioralAnalyzer()
-        self.url_extractor = SimpleURLExtractor()
+        self.url_extractor = default_url_extractor if default_url_extractor is not None else SimpleURLExtractor()
         
         # Conditionally initialize advanced components
         self.llm_analyzer = LLMAnalyzer() if LLM_AVAILABLE else None
@@ -123,6 +123,16 @@ class BehavioralAnalyzer:
             'poor_grammar': [re.compile(p, re.IGNORECASE) for p in self.poor_grammar_patterns]
         }
         
+        # Score weight per match for each tactic
+        self.tactic_weights = {
+            'sensitive_request': 0.25,  # Higher weight for sensitive request/impersonation
+            'impersonation': 0.25,
+            'urgency': 0.2,  # High weight for urgency and fear tactics
+            'fear': 0.2,
+            'poor_grammar': 0.1  # Lower weight for grammar issues
+        }
+        self.default_tactic_weight = 0.15
+        
     def analyze_text(self, text: str) -> Dict[str, Any]:
         """
         Analyze text for behavioral manipulation patterns.
@@ -156,15 +166,7 @@ class BehavioralAnalyzer:
             
             if matches:
                 # Calculate score based on number of matches and pattern type
-                # Different weights for different patterns
-                if tactic in ['sensitive_request', 'impersonation']:
-                    weight = 0.25  # Higher weight for sensitive request/impersonation
-                elif tactic in ['urgency', 'fear']:
-                    weight = 0.2  # High weight for urgency and fear tactics
-                elif tactic == 'poor_grammar':
-                    weight = 0.1  # Lower weight for grammar issues
-                else:
-                    weight = 0.15  # Default weight
+                weight = self.tactic_weights.get(tactic, self.default_tactic_weight)
                 
                 # Calculate score, capped at max per category
                 score = min(0.9, len(matches) * weight)
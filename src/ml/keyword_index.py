@@ -0,0 +1,60 @@
+"""
+PhishLock AI Keyword Index
+Finds every occurrence of many keywords in a single pass over a text
+"""
+
+from typing import Any, Iterable, Iterator, Tuple
+
+# pyahocorasick builds an Aho-Corasick automaton in C; without it we fall back
+# to one str.find() sweep per keyword
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+class KeywordIndex:
+    def __init__(self, entries: Iterable[Tuple[str, Any]]):
+        """
+        Build the index.
+
+        Args:
+            entries: (keyword, value) pairs. Keywords are matched exactly, so
+                lowercase them (and the text) for case-insensitive matching.
+                A keyword added more than once reports all of its values.
+        """
+        values_by_keyword = {}
+        for keyword, value in entries:
+            if keyword:
+                values_by_keyword.setdefault(keyword, []).append(value)
+        self.keywords = {keyword: tuple(values) for keyword, values in values_by_keyword.items()}
+
+        self._automaton = None
+        if AHOCORASICK_AVAILABLE and self.keywords:
+            self._automaton = ahocorasick.Automaton()
+            for keyword, values in self.keywords.items():
+                self._automaton.add_word(keyword, (len(keyword), values))
+            self._automaton.make_automaton()
+
+    def iter(self, text: str) -> Iterator[Tuple[int, int, Tuple[Any, ...]]]:
+        """
+        Find all keyword occurrences in a text, including overlapping ones.
+
+        Args:
+            text: Text to scan
+
+        Returns:
+            Iterator of (start, end, values) for each occurrence, where
+            text[start:end] is the keyword and values are those it was added with
+        """
+        if self._automaton is not None:
+            for last_index, (length, values) in self._automaton.iter(text):
+                end = last_index + 1
+                yield end - length, end, values
+            return
+
+        for keyword, values in self.keywords.items():
+            start = text.find(keyword)
+            while start != -1:
+                yield start, start + len(keyword), values
+                start = text.find(keyword, start + 1)
@@ -160,8 +160,14 @@ class KnowledgeBase:
     
     def _save_knowledge_base(self):
         """Save the knowledge base to disk"""
+        # The timestamp is kept as a datetime and only stringified when flushed
+        if self.last_update:
+            self.data['last_update'] = self.last_update.isoformat()
+        
+        # Serialize up front so the file gets one write instead of one per JSON chunk
+        serialized = json.dumps(self.data, indent=2)
         with open(self.knowledge_base_path, 'w') as f:
-            json.dump(self.data, f, indent=2)
+            f.write(serialized)
     
     def _check_update(self):
         """Check if the knowledge base needs updating"""
@@ -176,7 +182,6 @@ class KnowledgeBase:
         """
         # In a real implementation, you might fetch updates from a central repository
         # For now, we'll just update the timestamp
-        self.data['last_update'] = datetime.now().isoformat()
         self.last_update = datetime.now()
         self._save_knowledge_base()
         
@@ -2,18 +2,57 @@
 LLM-based phishing detection component for PhishLock AI
 """
 import os
+import hashlib
 import requests
 import json
 from dotenv import load_dotenv
 
+# orjson decodes API replies considerably faster; fall back to the stdlib if missing.
+# orjson.JSONDecodeError subclasses json.JSONDecodeError, so handlers stay the same.
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
 # Load environment variables
 load_dotenv()
 
+# Analysis prompt, filled in with the message's sender, subject and content
+ANALYSIS_PROMPT_TEMPLATE = """
+        You are an expert at detecting sophisticated phishing attempts. Analyze this message and determine if it appears to be a phishing attempt.
+        
+        SENDER: {sender}
+        SUBJECT: {subject}
+        CONTENT: {content}
+        
+        Provide your analysis in the following JSON format:
+        {{
+            "is_phishing": true/false,
+            "confidence": 0-1 (float),
+            "techniques_detected": ["list", "of", "techniques"],
+            "reasoning": "Detailed explanation of your reasoning",
+            "score": 0-1 (float)
+        }}
+        
+        Consider the following in your analysis:
+        1. Brand impersonation
+        2. Psychological manipulation tactics
+        3. Urgency or pressure tactics
+        4. Suspicious links or domains
+        5. Grammatical errors or odd phrasing
+        6. Request for sensitive information
+        7. Inconsistencies in sender information
+        8. Use of threatening language
+        """
+
 class LLMAnalyzer:
     def __init__(self):
         self.api_key = os.getenv("OPENAI_API_KEY") or os.getenv("ANTHROPIC_API_KEY")
         self.api_provider = "openai" if os.getenv("OPENAI_API_KEY") else "anthropic"
         self.cache = {}  # Simple in-memory cache
+        # Bind the template's formatter once; rendering is then a single C-level call
+        self._render_prompt = ANALYSIS_PROMPT_TEMPLATE.format_map
         
     def detect_sophisticated_phishing(self, message):
         """
@@ -25,9 +64,34 @@ class LLMAnalyzer:
         Returns:
             dict: Analysis results including score and reasoning
         """
-        # Create a cache key
-        cache_key = f"{message['sender']}|{message['subject']}|{message['content'][:100]}"
+        return self._detect(self._cache_key(message), message)
+    
+    def detect_batch(self, messages):
+        """
+        Analyze a batch of messages, querying the LLM once per distinct message
+        
+        Mass phishing campaigns often repeat the same message, so duplicates
+        share a single API call and cached result.
         
+        Args:
+            messages (list): Messages containing 'sender', 'subject', and 'content'
+            
+        Returns:
+            list: Analysis results, in the same order as messages
+        """
+        keys = [self._cache_key(message) for message in messages]
+        unique = dict(zip(keys, messages))
+        results = {key: self._detect(key, message) for key, message in unique.items()}
+        return [results[key] for key in keys]
+    
+    def _cache_key(self, message):
+        """Create a compact cache key from the message's sender, subject and content"""
+        key_data = f"{message['sender']}|{message['subject']}|{message['content']}"
+        # surrogatepass keeps lone surrogates (e.g. from surrogateescape-decoded mail) hashable
+        return hashlib.blake2b(key_data.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+    
+    def _detect(self, cache_key, message):
+        """Run the LLM analysis for a message, using the cache when possible"""
         # Check cache first
         if cache_key in self.cache:
             return self.cache[cache_key]
@@ -48,32 +112,7 @@ class LLMAnalyzer:
     
     def _create_analysis_prompt(self, message):
         """Create a detailed prompt for the LLM"""
-        return f"""
-        You are an expert at detecting sophisticated phishing attempts. Analyze this message and determine if it appears to be a phishing attempt.
-        
-        SENDER: {message['sender']}
-        SUBJECT: {message['subject']}
-        CONTENT: {message['content']}
-        
-        Provide your analysis in the following JSON format:
-        {{
-            "is_phishing": true/false,
-            "confidence": 0-1 (float),
-            "techniques_detected": ["list", "of", "techniques"],
-            "reasoning": "Detailed explanation of your reasoning",
-            "score": 0-1 (float)
-        }}
-        
-        Consider the following in your analysis:
-        1. Brand impersonation
-        2. Psychological manipulation tactics
-        3. Urgency or pressure tactics
-        4. Suspicious links or domains
-        5. Grammatical errors or odd phrasing
-        6. Request for sensitive information
-        7. Inconsistencies in sender information
-        8. Use of threatening language
-        """
+        return self._render_prompt(message)
     
     def _query_openai(self, prompt):
         """Query OpenAI API"""
@@ -99,11 +138,11 @@ class LLMAnalyzer:
             )
             
             if response.status_code == 200:
-                result = response.json()
+                result = json_loads(response.content)
                 # Extract and parse JSON from response
                 content = result["choices"][0]["message"]["content"].strip()
                 try:
-                    return json.loads(content)
+                    return json_loads(content)
                 except json.JSONDecodeError:
                     # Fallback if response isn't proper JSON
                     return self._extract_result_from_text(content)
@@ -140,10 +179,10 @@ class LLMAnalyzer:
             )
             
             if response.status_code == 200:
-                result = response.json()
+                result = json_loads(response.content)
                 content = result["completion"].strip()
                 try:
-                    return json.loads(content)
+                    return json_loads(content)
                 except json.JSONDecodeError:
                     return self._extract_result_from_text(content)
             else:
@@ -156,7 +195,8 @@ class LLMAnalyzer:
     
     def _extract_result_from_text(self, text):
         """Extract results from text if JSON parsing fails"""
-        is_phishing = "phishing" in text.lower() and "not phishing" not in text.lower()
+        lowered = text.lower()
+        is_phishing = "phishing" in lowered and "not phishing" not in lowered
         
         return {
             "is_phishing": is_phishing,
@@ -4,13 +4,177 @@ Detects brand logos in HTML content to identify brand impersonation
 """
 
 import re
-from typing import Dict, List, Any, Optional, Tuple
-from bs4 import BeautifulSoup
+import functools
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, Iterator, List, Any, Optional, Pattern, Tuple
+from bs4 import BeautifulSoup, SoupStrainer
 import requests
 import hashlib
-from urllib.parse import urljoin, urlparse
+from urllib.parse import urljoin, urlparse, urlsplit
+from html import unescape
 import os
 
+# The regex parser moved to re._parser in Python 3.11 (sre_parse is deprecated there)
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+# Prefer lxml's C parser over the pure-Python html.parser when it's installed
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+# google-re2 matches every brand filename pattern in one linear-time pass;
+# without it the fused re lookahead pattern is used
+try:
+    import re2
+    RE2_AVAILABLE = True
+except ImportError:
+    RE2_AVAILABLE = False
+
+# Only <img> tags and inline-styled elements are needed for logo extraction, so
+# restrict tree building to those. beautifulsoup4 4.13 moved parse-time filtering
+# to ElementFilter.allow_tag_creation(); older releases call a callable name
+# filter with the tag's name and attributes.
+try:
+    from bs4.filter import ElementFilter
+
+    class _ImageElementFilter(ElementFilter):
+        def allow_tag_creation(self, nsprefix, name, attrs):
+            return name == 'img' or bool(attrs and 'style' in attrs)
+
+        def allow_string_creation(self, string):
+            return False
+
+    _IMAGE_STRAINER = _ImageElementFilter()
+except ImportError:
+    _IMAGE_STRAINER = SoupStrainer(lambda name, attrs: name == 'img' or 'style' in attrs)
+
+# Literal leading word(s) of a brand filename pattern, e.g. "(microsoft|ms).*"
+_PATTERN_PREFIX_RE = re.compile(r'\(?([\w|-]+)\)?\.\*')
+
+def _alternation_around_prefix(pattern: str, prefix: str) -> bool:
+    """
+    Whether a pattern has an alternation at its top level, or inside a group
+    opened by its leading word(s) and closed after them, as in "(chase.*|jpmorgan.*)".
+    """
+    items = sre_parse.parse(pattern)
+    if any(op is sre_parse.BRANCH for op, _ in items):
+        return True
+    if prefix.startswith('(') and ')' not in prefix:
+        op, av = items[0]
+        return op is sre_parse.SUBPATTERN and any(sub_op is sre_parse.BRANCH for sub_op, _ in av[-1])
+    return False
+
+def _brand_token_regex(patterns: Iterable[str]) -> Optional[Pattern[str]]:
+    """
+    Regex for the leading words of brand filename patterns, which an src must
+    contain to match any of them. Returns None if a pattern has no such prefix,
+    or has an alternation around it (as in "chase.*|jpmorgan.*"), since its
+    matches then need not contain the prefix.
+    """
+    tokens = []
+    for pattern in patterns:
+        prefix = _PATTERN_PREFIX_RE.match(pattern)
+        if prefix is None or _alternation_around_prefix(pattern, prefix.group()):
+            return None
+        tokens.extend(prefix.group(1).split('|'))
+    if not tokens:
+        return None
+    return re.compile('|'.join(map(re.escape, dict.fromkeys(tokens))), re.IGNORECASE)
+
+# CSS background / background-image url(...) references
+_BG_URL_RE = re.compile(r'background(?:-image)?:\s*url\([\'"]?([^\'")]+)[\'"]?\)', re.IGNORECASE)
+
+# Regex fast path for image extraction: <img> tag starts, the characters that
+# can end or quote within a tag, attributes, and inline style attributes
+# (scanned for background images). Attribute names only match from the start
+# of a word, so long attribute-less runs are scanned once, not once per character.
+_IMG_START_RE = re.compile(r'<img\b', re.IGNORECASE)
+_TAG_DELIMITER_RE = re.compile(r'[>"\']')
+_ATTR_RE = re.compile(r'(?<![\w:-])([\w:-]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s"\'>]+))')
+_STYLE_ATTR_RE = re.compile(r'(?<![\w:-])style\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s"\'>]+))', re.IGNORECASE)
+
+# Markup whose contents the HTML parser never turns into elements: comments,
+# CDATA sections and raw text elements (scripts, styles, textareas...). It is
+# removed before the regex sweep so markup inside it isn't mistaken for images.
+_NON_ELEMENT_MARKUP_RE = re.compile(
+    r'<!--.*?(?:-->|$)|<!\[CDATA\[.*?(?:\]\]>|$)'
+    r'|<(script|style|textarea|title|xmp|iframe|noembed|noframes)\b.*?(?:</\1\s*>|$)',
+    re.IGNORECASE | re.DOTALL
+)
+
+# lxml keeps the first of a repeated attribute, html.parser the last
+_FIRST_DUPLICATE_ATTR_WINS = HTML_PARSER == 'lxml'
+
+def _iter_img_tags(markup: str) -> Iterator[str]:
+    """
+    Yield the text of each <img ...> tag in linear time.
+    
+    Quoted attribute values may contain '>'. The sweep stops at the first tag
+    without a closing '>' (or with an unterminated quote), since everything
+    after it would otherwise be rescanned from each later <img.
+    """
+    pos = 0
+    while True:
+        start = _IMG_START_RE.search(markup, pos)
+        if start is None:
+            return
+        
+        pos = start.end()
+        while True:
+            delimiter = _TAG_DELIMITER_RE.search(markup, pos)
+            if delimiter is None:
+                return
+            pos = delimiter.end()
+            if delimiter.group() == '>':
+                break
+            pos = markup.find(delimiter.group(), pos) + 1
+            if pos == 0:
+                return
+        
+        yield markup[start.start():pos]
+
+# Number of distinct image src/alt pairs whose brand scores are kept in memory
+SRC_CACHE_SIZE = 100000
+
+# Root-relative image URLs can skip urljoin unless they contain anything it would
+# normalise: dot segments, path parameters, stripped control characters or empty
+# query/fragment markers. Protocol-relative ones also need a non-empty host
+# without IPv6 brackets.
+_URLJOIN_NEEDED_RE = re.compile(r'/\.|[\t\r\n;]|\?#|[?#]$')
+_EMPTY_NETLOC_RE = re.compile(r'//(?:$|[/?#\\])')
+
+@functools.lru_cache(maxsize=256)
+def _base_origin(base_url: str) -> Optional[Tuple[str, str]]:
+    """Scheme and host of an http(s) base URL, or None for anything else."""
+    parts = urlsplit(base_url)
+    if parts.scheme in ('http', 'https') and parts.netloc:
+        return parts.scheme, parts.netloc
+    return None
+
+# Leading integer of an HTML width/height attribute ("20", "20px", " 20 ")
+_PX_RE = re.compile(r'\s*(\d+)')
+
+def _px(value: str) -> Optional[int]:
+    """Parse a width/height attribute as whole pixels, or None if it isn't numeric."""
+    match = _PX_RE.match(value)
+    return int(match.group(1)) if match else None
+
+@dataclass
+class BrandProfile:
+    """Brand data used on the image matching hot path, prepared once per detector."""
+    __slots__ = ('name', 'keywords', 'keywords_lc')
+    
+    name: str
+    keywords: Tuple[Tuple[str, str], ...]  # (keyword, lowercase keyword) pairs
+    keywords_lc: Tuple[str, ...]
+
 class LogoDetector:
     def __init__(self):
         """Initialize the logo detector."""
@@ -83,6 +247,57 @@ class LogoDetector:
             }
         }
         
+        # Fuse every brand's filename patterns into one regex so each image src is
+        # checked in a single call. Each brand gets an optional lookahead that
+        # searches the whole src and captures into a group named after the brand,
+        # so an image matching several brands is still attributed to all of them.
+        self._brand_url_re = re.compile(
+            ''.join(
+                f"(?:(?=(?s:.*?)(?P<{brand}>{'|'.join(brand_info['patterns'])}))|)"
+                for brand, brand_info in self.brand_logos.items()
+            ),
+            re.IGNORECASE
+        )
+        
+        # The same patterns as an RE2 set, reporting the brand of each pattern that matches
+        self._brand_pattern_set = None
+        if RE2_AVAILABLE:
+            try:
+                options = re2.Options()
+                options.case_sensitive = False
+                pattern_set = re2.Set.SearchSet(options)
+                self._brand_pattern_set_brands = []
+                for brand, brand_info in self.brand_logos.items():
+                    for pattern in brand_info['patterns']:
+                        pattern_set.Add(pattern)
+                        self._brand_pattern_set_brands.append(brand)
+                pattern_set.Compile()
+                self._brand_pattern_set = pattern_set
+            except Exception as e:
+                print(f"Error compiling brand patterns with RE2, using re instead: {e}")
+        
+        # Every filename pattern starts with a literal word, so an src containing
+        # none of them cannot match any brand and skips the lookahead sweep.
+        self._brand_token_re = _brand_token_regex(
+            pattern for brand_info in self.brand_logos.values() for pattern in brand_info['patterns']
+        )
+        
+        # Brand keywords paired with their lowercase form for alt text and domain checks
+        self._brand_profiles = {}
+        for brand, brand_info in self.brand_logos.items():
+            keywords = tuple((keyword, keyword.lower()) for keyword in brand_info['keywords'])
+            self._brand_profiles[brand] = BrandProfile(
+                name=brand,
+                keywords=keywords,
+                keywords_lc=tuple(keyword_lc for _, keyword_lc in keywords)
+            )
+        
+        # Phishing kits reuse the same image URLs across many pages, and scoring
+        # only depends on the src and alt, so remember results across calls.
+        # Entries are keyed by a digest, since srcs can be multi-MB data: URLs.
+        self._src_cache = OrderedDict()
+        self._src_cache_lock = threading.Lock()
+        
         # Cache directory for downloaded images
         self.cache_dir = "data/logo_cache"
         os.makedirs(self.cache_dir, exist_ok=True)
@@ -99,7 +314,7 @@ class LogoDetector:
             List of image information dictionaries
         """
         try:
-            soup = BeautifulSoup(html_content, 'html.parser')
+            soup = BeautifulSoup(html_content, HTML_PARSER, parse_only=_IMAGE_STRAINER)
             images = []
             
             # Extract all image tags
@@ -110,12 +325,14 @@ class LogoDetector:
                 height = img.get('height', '')
                 
                 # Skip very small or empty images
-                if not src or (width and height and int(width) < 20 and int(height) < 20):
+                if not src:
+                    continue
+                w, h = _px(width), _px(height)
+                if w is not None and h is not None and w < 20 and h < 20:
                     continue
                 
                 # Resolve relative URLs if base_url is provided
-                if base_url and not src.startswith(('http://', 'https://', 'data:')):
-                    src = urljoin(base_url, src)
+                src = self._resolve_image_url(src, base_url)
                 
                 images.append({
                     'src': src,
@@ -127,27 +344,194 @@ class LogoDetector:
             # Also check for background images in CSS
             for elem in soup.find_all(style=True):
                 style = elem.get('style', '')
-                background_urls = re.findall(r'background(-image)?:\s*url\([\'"]?([^\'"]*)[\'"]?\)', style)
+                if 'url(' not in style.lower():
+                    continue
                 
-                for _, url in background_urls:
-                    if url:
-                        # Resolve relative URLs
-                        if base_url and not url.startswith(('http://', 'https://', 'data:')):
-                            url = urljoin(base_url, url)
-                        
+                for background_url in _BG_URL_RE.finditer(style):
+                    # Resolve relative URLs
+                    url = self._resolve_image_url(background_url.group(1), base_url)
+                    
+                    images.append({
+                        'src': url,
+                        'alt': '',
+                        'width': '',
+                        'height': '',
+                        'type': 'background'
+                    })
+            
+            return images
+            
+        except Exception as e:
+            print(f"Error extracting images from HTML: {e}")
+            return []
+    
+    def fast_extract_images(self, html_content: str, base_url: Optional[str] = None, strict: bool = False) -> List[Dict[str, Any]]:
+        """
+        Extract image information from HTML content with a regex sweep.
+        
+        Much faster than building a DOM, at the cost of not recovering images
+        from badly malformed markup. Comments, scripts, styles and other raw
+        text elements are skipped like the parser does, but tag-like text in
+        attribute values or page text can still be picked up. Falls back to
+        extract_images_from_html when the sweep finds nothing or strict is set.
+        
+        Args:
+            html_content: HTML content to scan
+            base_url: Base URL for resolving relative URLs
+            strict: Always use the full HTML parser
+            
+        Returns:
+            List of image information dictionaries
+        """
+        if not strict:
+            try:
+                images = []
+                markup = _NON_ELEMENT_MARKUP_RE.sub(' ', html_content)
+                
+                # Extract all image tags
+                for tag in _iter_img_tags(markup):
+                    attrs = {}
+                    for attr in _ATTR_RE.finditer(tag):
+                        name = attr.group(1).lower()
+                        if name not in attrs or not _FIRST_DUPLICATE_ATTR_WINS:
+                            value = attr.group(2) or attr.group(3) or attr.group(4) or ''
+                            attrs[name] = unescape(value)
+                    
+                    src = attrs.get('src', '')
+                    width = attrs.get('width', '')
+                    height = attrs.get('height', '')
+                    
+                    # Skip very small or empty images
+                    if not src:
+                        continue
+                    w, h = _px(width), _px(height)
+                    if w is not None and h is not None and w < 20 and h < 20:
+                        continue
+                    
+                    images.append({
+                        'src': self._resolve_image_url(src, base_url),
+                        'alt': attrs.get('alt', ''),
+                        'width': width,
+                        'height': height
+                    })
+                
+                # Also check for background images in inline styles
+                for style_attr in _STYLE_ATTR_RE.finditer(markup):
+                    style = unescape(style_attr.group(1) or style_attr.group(2) or style_attr.group(3) or '')
+                    if 'url(' not in style.lower():
+                        continue
+                    
+                    for background_url in _BG_URL_RE.finditer(style):
                         images.append({
-                            'src': url,
+                            'src': self._resolve_image_url(background_url.group(1), base_url),
                             'alt': '',
                             'width': '',
                             'height': '',
                             'type': 'background'
                         })
+                
+                if images:
+                    return images
+                
+            except Exception as e:
+                print(f"Error extracting images with regex fast path: {e}")
+        
+        return self.extract_images_from_html(html_content, base_url)
+    
+    def _resolve_image_url(self, url: str, base_url: Optional[str]) -> str:
+        """Resolve a relative image URL against base_url, if one is given."""
+        if not base_url or url.startswith(('http://', 'https://', 'data:')):
+            return url
+        
+        # Root- and protocol-relative URLs only need the base scheme and host
+        if url.startswith('/') and not _URLJOIN_NEEDED_RE.search(url):
+            origin = _base_origin(base_url)
+            if origin is not None:
+                if not url.startswith('//'):
+                    return f"{origin[0]}://{origin[1]}{url}"
+                if not _EMPTY_NETLOC_RE.match(url) and '[' not in url and ']' not in url:
+                    return f"{origin[0]}:{url}"
+        
+        return urljoin(base_url, url)
+    
+    def _match_brand_patterns(self, src: str) -> FrozenSet[str]:
+        """Brands with a filename pattern that matches an image src."""
+        if self._brand_token_re is not None and not self._brand_token_re.search(src):
+            return frozenset()
+        
+        if self._brand_pattern_set is not None:
+            try:
+                pattern_ids = self._brand_pattern_set.Match(src) or ()
+                return frozenset(self._brand_pattern_set_brands[i] for i in pattern_ids)
+            except UnicodeEncodeError:
+                # RE2 needs UTF-8 input; lone surrogates go through re instead
+                pass
+        
+        src_match = self._brand_url_re.match(src)
+        return frozenset(brand for brand, group in src_match.groupdict().items() if group is not None)
+    
+    def _classify_src(self, src: str, alt: str) -> Dict[str, Tuple[float, Tuple[str, ...]]]:
+        """
+        Score one image against every brand.
+        
+        Args:
+            src: Image URL
+            alt: Image alt text
             
-            return images
+        Returns:
+            Mapping of brand to (score, reasons) for each brand the image matches.
+            Results are cached, so callers must not modify them.
+        """
+        # Length-prefix the src so no two (src, alt) pairs hash the same text
+        key_data = f"{len(src)}:{src}{alt}"
+        key = hashlib.blake2b(key_data.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+        
+        with self._src_cache_lock:
+            brand_scores = self._src_cache.get(key)
+            if brand_scores is not None:
+                self._src_cache.move_to_end(key)
+                return brand_scores
+        
+        brand_scores = self._score_src(src, alt)
+        
+        with self._src_cache_lock:
+            self._src_cache[key] = brand_scores
+            if len(self._src_cache) > SRC_CACHE_SIZE:
+                self._src_cache.popitem(last=False)
+        
+        return brand_scores
+    
+    def _score_src(self, src: str, alt: str) -> Dict[str, Tuple[float, Tuple[str, ...]]]:
+        """Uncached implementation of _classify_src."""
+        brand_scores = {}
+        
+        # Match the filename against all brand patterns at once
+        matched_brands = self._match_brand_patterns(src)
+        alt = alt.lower()
+        
+        for profile in self._brand_profiles.values():
+            brand = profile.name
+            score = 0.0
+            match_reason = []
             
-        except Exception as e:
-            print(f"Error extracting images from HTML: {e}")
-            return []
+            # Check if image filename matches brand patterns
+            if brand in matched_brands:
+                score += 0.4
+                match_reason.append(f"Filename matches {brand} pattern")
+            
+            # Check if alt text contains brand keywords
+            for keyword, keyword_lc in profile.keywords:
+                if keyword_lc in alt:
+                    score += 0.3
+                    match_reason.append(f"Alt text contains {keyword}")
+                    break
+            
+            #Here we would download and analyze the image content For now, we just use the patterns and keywords
+            
+            if score > 0.3:
+                brand_scores[brand] = (score, tuple(match_reason))
+        
+        return brand_scores
     
     def analyze_image_urls(self, image_urls: List[Dict[str, Any]]) -> Dict[str, Any]:
         """
@@ -167,37 +551,21 @@ class LogoDetector:
             'strongest_match_score': 0.0
         }
         
-        for brand, brand_info in self.brand_logos.items():
+        # Pages often repeat the same logo, so score each distinct src/alt pair once
+        image_keys = [(img.get('src', ''), img.get('alt', '')) for img in image_urls]
+        image_scores = {key: self._classify_src(*key) for key in dict.fromkeys(image_keys)}
+        
+        for brand in self._brand_profiles:
             brand_matches = []
             
-            for img in image_urls:
-                score = 0.0
-                match_reason = []
-                
-                src = img.get('src', '')
-                alt = img.get('alt', '').lower()
-                
-                # Check if image filename matches brand patterns
-                for pattern in brand_info['patterns']:
-                    if re.search(pattern, src, re.IGNORECASE):
-                        score += 0.4
-                        match_reason.append(f"Filename matches {brand} pattern")
-                        break
-                
-                # Check if alt text contains brand keywords
-                for keyword in brand_info['keywords']:
-                    if keyword.lower() in alt:
-                        score += 0.3
-                        match_reason.append(f"Alt text contains {keyword}")
-                        break
-                
-                #Here we would download and analyze the image content For now, we just use the patterns and keywords
-                
-                if score > 0.3:
+            for img, key in zip(image_urls, image_keys):
+                brand_match = image_scores[key].get(brand)
+                if brand_match is not None:
+                    score, match_reason = brand_match
                     brand_matches.append({
                         'image': img,
                         'score': score,
-                        'reasons': match_reason
+                        'reasons': list(match_reason)
                     })
             
             if brand_matches:
@@ -220,19 +588,24 @@ class LogoDetector:
         
         return results
     
-    def analyze_html_for_brand_logos(self, html_content: str, url: Optional[str] = None) -> Dict[str, Any]:
+    def analyze_html_for_brand_logos(self, html_content: str, url: Optional[str] = None, fast: bool = False) -> Dict[str, Any]:
         """
         Analyze HTML content for brand logos.
         
         Args:
             html_content: HTML content to analyze
             url: URL of the HTML content for resolving relative URLs
+            fast: Extract images with the regex sweep (fast_extract_images)
+                instead of the HTML parser
             
         Returns:
             Analysis results
         """
         # Extract images from HTML
-        images = self.extract_images_from_html(html_content, url)
+        if fast:
+            images = self.fast_extract_images(html_content, url)
+        else:
+            images = self.extract_images_from_html(html_content, url)
         
         # Analyze images for brand logos
         logo_analysis = self.analyze_image_urls(images)
@@ -253,10 +626,10 @@ class LogoDetector:
         
         if logo_analysis['strongest_brand_match'] and domain:
             brand = logo_analysis['strongest_brand_match']
-            brand_info = self.brand_logos[brand]
+            domain_lc = domain.lower()
             
             # Check if domain contains brand name or keywords
-            if not any(keyword.lower() in domain.lower() for keyword in brand_info['keywords']):
+            if not any(keyword_lc in domain_lc for keyword_lc in self._brand_profiles[brand].keywords_lc):
                 impersonation_detected = True
                 impersonated_brand = brand
                 impersonation_confidence = logo_analysis['strongest_match_score']
@@ -3,23 +3,147 @@ PhishLock AI RAG Analyzer
 Implements Retrieval-Augmented Generation for phishing detection
 """
 
+import asyncio
 import re
-from typing import Dict, List, Tuple, Any, Optional
-from openai import OpenAI
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, List, Tuple, Any, Optional
+from collections import OrderedDict
+from openai import OpenAI, AsyncOpenAI
+import copy
+import hashlib
 import json
 import os
+import threading
 from dotenv import load_dotenv
 
 from .knowledge_base import PhishingKnowledgeBase
+from .keyword_index import KeywordIndex
+
+# orjson parses LLM replies faster; fall back to the stdlib if missing
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
 
 # Load environment variables
 load_dotenv()
 
+# Number of messages whose retrieval and analysis results are kept in memory
+RESULT_CACHE_SIZE = 4096
+
+# Maximum number of concurrent LLM requests when analyzing a batch of messages
+LLM_CONCURRENCY = 8
+
+# Phrases the heuristic score looks for on top of the knowledge base
+URGENCY_WORDS = ["urgent", "immediately", "alert", "warning", "action required"]
+SENSITIVE_REQUESTS = ["password", "credential", "credit card", "ssn", "social security", "account number"]
+GRAMMAR_ISSUES = [
+    "kindly", "do the needful", "valued customer", "dear customer", 
+    "dear user", "dear account holder", "100%", "urgent attention"
+]
+
+@dataclass
+class BrandProfile:
+    """Brand sender checks prepared from the knowledge base."""
+    __slots__ = ('name', 'legitimate_domains', 'legitimate_domain_set', 'suspicious_patterns', 'common_subjects')
+    
+    name: str
+    legitimate_domains: List[str]
+    legitimate_domain_set: FrozenSet[str]
+    suspicious_patterns: Tuple[Tuple[str, str], ...]  # (pattern, lowercase pattern) pairs
+    common_subjects: List[str]
+
 class RAGPhishingAnalyzer:
     def __init__(self):
         """Initialize the RAG-based phishing analyzer."""
         self.knowledge_base = PhishingKnowledgeBase()
         self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.aclient = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        
+        # LRU caches keyed by a hash of the message, so repeated messages
+        # (retries, duplicate mails) skip retrieval, scoring and the LLM call
+        self._knowledge_cache = OrderedDict()
+        self._analysis_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        
+        self._build_keyword_index()
+        
+    def _build_keyword_index(self):
+        """
+        Index every knowledge base keyword so retrieval is a single pass over the
+        message. Call again after the knowledge base changes.
+        
+        Each keyword maps to (kind, key, original) entries: tactic indicators,
+        brand mentions (brand name and legitimate domains), brand subject lines,
+        common phishing pattern phrases and the heuristic score phrases.
+        
+        Brand sender checks are prepared here too: legitimate domains as a set
+        and suspicious patterns paired with their lowercase form.
+        """
+        entries = []
+        sender_patterns = []
+        brand_profiles = []
+        
+        for tactic_name, tactic_info in self.knowledge_base.get_all_tactics().items():
+            for indicator in tactic_info.get("indicators", []):
+                entries.append((indicator.lower(), ("tactic", tactic_name, indicator)))
+        
+        for brand_name, brand_info in self.knowledge_base.knowledge.get("brand_impersonation", {}).items():
+            entries.append((brand_name.lower(), ("brand", brand_name, brand_name)))
+            for domain in brand_info.get("related_domains", []):
+                entries.append((domain, ("brand", brand_name, domain)))
+            
+            legitimate_domains = brand_info.get("related_domains", [])
+            suspicious_patterns = tuple(
+                (pattern, pattern.lower()) for pattern in brand_info.get("suspicious_patterns", [])
+            )
+            sender_patterns.extend(pattern_lc for _, pattern_lc in suspicious_patterns)
+            brand_profiles.append(BrandProfile(
+                name=brand_name,
+                legitimate_domains=legitimate_domains,
+                legitimate_domain_set=frozenset(legitimate_domains),
+                suspicious_patterns=suspicious_patterns,
+                common_subjects=brand_info.get("common_subjects", [])
+            ))
+            
+            for common_subject in brand_info.get("common_subjects", []):
+                entries.append((common_subject.lower(), ("subject", brand_name, common_subject)))
+        
+        for pattern_type, pattern_list in self.knowledge_base.knowledge.get("common_phishing_patterns", {}).items():
+            for pattern in pattern_list:
+                entries.append((pattern.replace("_", " "), ("pattern", pattern_type, pattern)))
+        
+        for phrase in URGENCY_WORDS + SENSITIVE_REQUESTS + GRAMMAR_ISSUES:
+            entries.append((phrase, ("heuristic", None, phrase)))
+        
+        self._keyword_index = KeywordIndex(entries)
+        self._sender_patterns_lc = tuple(sender_patterns)
+        self._brand_profiles = tuple(brand_profiles)
+        
+        # Cached results may be stale once the knowledge base has changed
+        self._knowledge_cache.clear()
+        self._analysis_cache.clear()
+        
+    def _message_key(self, message: Dict[str, Any]) -> str:
+        """Stable hash of the message fields the analysis depends on."""
+        key_data = "\0".join((message.get('sender', ''), message.get('subject', ''), message.get('content', '')))
+        return hashlib.blake2b(key_data.encode('utf-8', 'surrogatepass'), digest_size=16).hexdigest()
+    
+    def _get_cached(self, cache: OrderedDict, key: str) -> Optional[Dict[str, Any]]:
+        """Return a cached result (shared, so not to be modified), marking it as recently used."""
+        with self._cache_lock:
+            result = cache.get(key)
+            if result is not None:
+                cache.move_to_end(key)
+            return result
+    
+    def _set_cached(self, cache: OrderedDict, key: str, result: Dict[str, Any]):
+        """Cache a result, evicting the least recently used entry if full."""
+        with self._cache_lock:
+            cache[key] = result
+            if len(cache) > RESULT_CACHE_SIZE:
+                cache.popitem(last=False)
         
     def retrieve_relevant_knowledge(self, message: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -31,25 +155,62 @@ class RAGPhishingAnalyzer:
         Returns:
             Dictionary of relevant knowledge for the RAG system
         """
+        return copy.deepcopy(self._cached_relevant_knowledge(message))
+    
+    def _cached_relevant_knowledge(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """Relevant knowledge for a message, shared with the cache, so not to be modified."""
+        key = self._message_key(message)
+        relevant_knowledge = self._get_cached(self._knowledge_cache, key)
+        if relevant_knowledge is None:
+            relevant_knowledge = self._retrieve_relevant_knowledge(message)
+            self._set_cached(self._knowledge_cache, key, relevant_knowledge)
+        return relevant_knowledge
+    
+    def _retrieve_relevant_knowledge(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """Uncached implementation of retrieve_relevant_knowledge."""
         relevant_knowledge = {
             "tactics": {},
             "brand_impersonation": None,
             "patterns": []
         }
         
+        # Lowercase each message component once
+        subject = message.get('subject', '').lower()
+        sender = message.get('sender', '').lower()
+        sender_domain = sender.split('@')[-1] if '@' in sender else sender
+        
         # Combine message components for analysis
         combined_text = f"{message.get('subject', '')} {message.get('content', '')}"
         combined_text = combined_text.lower()
         
+        # Find every knowledge base keyword in one pass over the text
+        tactic_hits = {}
+        mentioned_brands = set()
+        subject_hits = {}
+        pattern_hits = {}
+        for _, end, entries in self._keyword_index.iter(combined_text):
+            for kind, key, keyword in entries:
+                if kind == "tactic":
+                    tactic_hits.setdefault(key, set()).add(keyword)
+                elif kind == "brand":
+                    mentioned_brands.add(key)
+                elif kind == "subject":
+                    # The subject is the start of combined_text
+                    if end <= len(subject):
+                        subject_hits.setdefault(key, set()).add(keyword)
+                elif kind == "pattern":
+                    pattern_hits.setdefault(key, set()).add(keyword)
+        
         # Extract psychological tactics
         all_tactics = self.knowledge_base.get_all_tactics()
         for tactic_name, tactic_info in all_tactics.items():
-            indicators = tactic_info.get("indicators", [])
-            found_indicators = []
+            if tactic_name not in tactic_hits:
+                continue
             
-            for indicator in indicators:
-                if indicator.lower() in combined_text:
-                    found_indicators.append(indicator)
+            found_indicators = [
+                indicator for indicator in tactic_info.get("indicators", [])
+                if indicator in tactic_hits[tactic_name]
+            ]
                     
             if found_indicators:
                 relevant_knowledge["tactics"][tactic_name] = {
@@ -59,39 +220,28 @@ class RAGPhishingAnalyzer:
                 }
         
         # Check for brand impersonation
-        brands = self.knowledge_base.knowledge.get("brand_impersonation", {})
         impersonated_brand = None
         max_score = 0
         
-        for brand_name, brand_info in brands.items():
+        for profile in self._brand_profiles:
+            brand_name = profile.name
             score = 0
-            legitimate_domains = brand_info.get("related_domains", [])
-            suspicious_patterns = brand_info.get("suspicious_patterns", [])
-            common_subjects = brand_info.get("common_subjects", [])
-            
-            # Check sender domain against legitimate domains
-            sender = message.get('sender', '').lower()
-            sender_domain = sender.split('@')[-1] if '@' in sender else sender
             
             # If sender pretends to be from a legitimate brand but domain doesn't match
-            brand_mentioned = False
-            for domain in legitimate_domains:
-                if domain in combined_text or brand_name.lower() in combined_text:
-                    brand_mentioned = True
-                    break
+            brand_mentioned = bool(profile.legitimate_domains) and brand_name in mentioned_brands
                     
-            if brand_mentioned and not any(domain == sender_domain for domain in legitimate_domains):
+            if brand_mentioned and sender_domain not in profile.legitimate_domain_set:
                 score += 0.5  # Strong indicator of brand impersonation
             
             # Check for suspicious patterns in sender or domain
-            for pattern in suspicious_patterns:
-                if pattern.lower() in sender.lower():
-                    score += 0.3
+            detected_patterns = [p for p, p_lc in profile.suspicious_patterns if p_lc in sender]
+            for _ in detected_patterns:
+                score += 0.3
             
             # Check subject against common phishing subjects for this brand
-            subject = message.get('subject', '').lower()
-            for common_subject in common_subjects:
-                if common_subject.lower() in subject:
+            brand_subject_hits = subject_hits.get(brand_name, ())
+            for common_subject in profile.common_subjects:
+                if common_subject in brand_subject_hits:
                     score += 0.2
             
             if score > max_score:
@@ -99,8 +249,8 @@ class RAGPhishingAnalyzer:
                 impersonated_brand = {
                     "name": brand_name,
                     "score": score,
-                    "legitimate_domains": legitimate_domains,
-                    "detected_patterns": [p for p in suspicious_patterns if p.lower() in sender.lower()]
+                    "legitimate_domains": profile.legitimate_domains,
+                    "detected_patterns": detected_patterns
                 }
         
         if impersonated_brand and impersonated_brand["score"] > 0.2:
@@ -109,10 +259,13 @@ class RAGPhishingAnalyzer:
         # Identify common phishing patterns
         patterns = self.knowledge_base.knowledge.get("common_phishing_patterns", {})
         for pattern_type, pattern_list in patterns.items():
+            if pattern_type not in pattern_hits:
+                continue
+            
             for pattern in pattern_list:
                 # For simplicity, we're just checking if the pattern name is in the text
                 # In a real implementation, we'd have more sophisticated pattern matching
-                if pattern.replace("_", " ") in combined_text:
+                if pattern in pattern_hits[pattern_type]:
                     relevant_knowledge["patterns"].append({
                         "type": pattern_type,
                         "pattern": pattern
@@ -120,6 +273,31 @@ class RAGPhishingAnalyzer:
         
         return relevant_knowledge
     
+    def _quick_screen(self, message: Dict[str, Any]) -> Optional[float]:
+        """
+        Cheaply score messages that are trivially benign.
+        
+        A message that contains no knowledge base keyword or heuristic phrase,
+        and whose sender matches no suspicious brand pattern, retrieves no
+        knowledge and scores 0.0 whatever else it contains. Anything else needs
+        the full retrieval to be scored.
+        
+        Args:
+            message: A dictionary containing 'sender', 'subject', and 'content' keys
+            
+        Returns:
+            The heuristic score if it is known without retrieval, otherwise None
+        """
+        sender = message.get('sender', '').lower()
+        if any(pattern in sender for pattern in self._sender_patterns_lc):
+            return None
+        
+        combined_text = f"{message.get('subject', '')} {message.get('content', '')}".lower()
+        if next(self._keyword_index.iter(combined_text), None) is not None:
+            return None
+        
+        return 0.0
+    
     def generate_prompt_with_context(self, message: Dict[str, Any], relevant_knowledge: Dict[str, Any]) -> str:
         """
         Generate a prompt for the LLM with relevant context from the knowledge base.
@@ -216,74 +394,190 @@ class RAGPhishingAnalyzer:
         subject = message.get('subject', '').lower()
         
         # Check for urgency indicators in subject
-        urgency_words = ["urgent", "immediately", "alert", "warning", "action required"]
-        if any(word in subject for word in urgency_words):
+        if any(word in subject for word in URGENCY_WORDS):
             score += 0.1
         
         # Check for request for sensitive information
-        sensitive_requests = ["password", "credential", "credit card", "ssn", "social security", "account number"]
-        if any(phrase in content for phrase in sensitive_requests):
+        if any(phrase in content for phrase in SENSITIVE_REQUESTS):
             score += 0.2
         
         # Check for poor grammar or spelling (simplified check)
-        grammar_issues = [
-            "kindly", "do the needful", "valued customer", "dear customer", 
-            "dear user", "dear account holder", "100%", "urgent attention"
-        ]
-        if any(issue in content for issue in grammar_issues):
+        if any(issue in content for issue in GRAMMAR_ISSUES):
             score += 0.1
         
         return min(1.0, score)  # Ensure score is between 0 and 1
     
+    def analyze_message(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Analyze a message for phishing using RAG and LLM.
+        
+        Results are cached per message, so repeated messages are answered
+        without retrieval, scoring or an LLM call.
+        """
+        key = self._message_key(message)
+        result = self._get_cached(self._analysis_cache, key)
+        if result is None:
+            result, cacheable = self._analyze_message(message)
+            if cacheable:
+                self._set_cached(self._analysis_cache, key, result)
+        return copy.deepcopy(result)
     
-def analyze_message(self, message: Dict[str, Any]) -> Dict[str, Any]:
-    """
-    Analyze a message for phishing using RAG and LLM.
-    """
-    # Retrieve relevant knowledge
-    relevant_knowledge = self.retrieve_relevant_knowledge(message)
-    
-    # Calculate heuristic score
-    heuristic_score = self.calculate_heuristic_score(message, relevant_knowledge)
+    async def analyze_messages(self, messages: List[Dict[str, Any]], max_concurrency: int = LLM_CONCURRENCY) -> List[Dict[str, Any]]:
+        """
+        Analyze a batch of messages for phishing, running LLM calls concurrently.
+        
+        Args:
+            messages: List of dictionaries containing 'sender', 'subject', and 'content' keys
+            max_concurrency: Maximum number of LLM requests in flight at once
+        
+        Returns:
+            List of analysis results, in the same order as the messages
+        """
+        keys = [self._message_key(message) for message in messages]
+        
+        # Answer cached messages directly and analyze each distinct new message once
+        results = {}
+        pending = {}
+        for key, message in zip(keys, messages):
+            if key in results or key in pending:
+                continue
+            cached = self._get_cached(self._analysis_cache, key)
+            if cached is not None:
+                results[key] = cached
+            else:
+                pending[key] = message
+        
+        semaphore = asyncio.Semaphore(max_concurrency)
+        analyses = await asyncio.gather(
+            *(self._analyze_message_async(message, semaphore) for message in pending.values())
+        )
+        for key, (result, cacheable) in zip(pending, analyses):
+            if cacheable:
+                self._set_cached(self._analysis_cache, key, result)
+            results[key] = result
+        
+        return [copy.deepcopy(results[key]) for key in keys]
     
-    # Use LLM if OpenAI API key is available and client is initialized
-    llm_result = None
-    if hasattr(self, 'client') and self.client:
-        # If heuristic score is very high or very low, we might skip LLM to save costs
-        skip_llm = heuristic_score > 0.85 or heuristic_score < 0.15
+    def _analyze_message(self, message: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+        """
+        Uncached implementation of analyze_message.
+        
+        Returns the result and whether it may be cached, which it may not be
+        when the LLM was needed but failed or gave no parseable answer.
+        """
+        relevant_knowledge, heuristic_score = self._score_message(message)
         
-        if not skip_llm:
+        # Use LLM if OpenAI API key is available and client is initialized
+        llm_result = None
+        llm_used = hasattr(self, 'client') and self.client and _needs_llm(heuristic_score)
+        if llm_used:
             try:
                 # Generate prompt with context
                 prompt = self.generate_prompt_with_context(message, relevant_knowledge)
-                
+        
                 # Call the LLM
-                response = self.client.chat.completions.create(
-                    model="gpt-3.5-turbo",
-                    messages=[
-                        {"role": "system", "content": "You are a cybersecurity expert analyzing emails for phishing."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=0.2
-                )
-                
+                response = self.client.chat.completions.create(**_llm_request(prompt))
+        
                 # Extract and parse the LLM response
-                content = response.choices[0].message.content
-                
-                # Try to parse JSON from the LLM response
-                try:
-                    # Look for JSON pattern in the response
-                    start_idx = content.find('{')
-                    end_idx = content.rfind('}') + 1
-                    
-                    if start_idx >= 0 and end_idx > start_idx:
-                        json_str = content[start_idx:end_idx]
-                        llm_result = json.loads(json_str)
-                except Exception as e:
-                    print(f"Error parsing LLM response: {e}")
+                llm_result = _parse_llm_response(response.choices[0].message.content)
+            except Exception as e:
+                print(f"Error calling LLM: {e}")
+        
+        cacheable = not llm_used or llm_result is not None
+        return _combine_results(relevant_knowledge, heuristic_score, llm_result), cacheable
+    
+    async def _analyze_message_async(self, message: Dict[str, Any], semaphore: asyncio.Semaphore) -> Tuple[Dict[str, Any], bool]:
+        """
+        Uncached implementation of analyze_message using the async OpenAI client.
+        """
+        relevant_knowledge, heuristic_score = self._score_message(message)
+        
+        llm_result = None
+        llm_used = hasattr(self, 'aclient') and self.aclient and _needs_llm(heuristic_score)
+        if llm_used:
+            try:
+                prompt = self.generate_prompt_with_context(message, relevant_knowledge)
+        
+                async with semaphore:
+                    response = await self.aclient.chat.completions.create(**_llm_request(prompt))
+        
+                llm_result = _parse_llm_response(response.choices[0].message.content)
             except Exception as e:
                 print(f"Error calling LLM: {e}")
+        
+        cacheable = not llm_used or llm_result is not None
+        return _combine_results(relevant_knowledge, heuristic_score, llm_result), cacheable
+    
+    def _score_message(self, message: Dict[str, Any]) -> Tuple[Dict[str, Any], float]:
+        """
+        Retrieve the relevant knowledge for a message and compute its heuristic score.
+        """
+        # Trivially benign messages skip retrieval, the prompt and the LLM entirely
+        heuristic_score = self._quick_screen(message)
+        if heuristic_score is not None:
+            relevant_knowledge = {
+                "tactics": {},
+                "brand_impersonation": None,
+                "patterns": []
+            }
+        else:
+            # Retrieve relevant knowledge (only read here, so no copy is needed)
+            relevant_knowledge = self._cached_relevant_knowledge(message)
+        
+            # Calculate heuristic score
+            heuristic_score = self.calculate_heuristic_score(message, relevant_knowledge)
+        
+        return relevant_knowledge, heuristic_score
+
+
+def _needs_llm(heuristic_score: float) -> bool:
+    """
+    Whether the heuristic score is uncertain enough to be worth an LLM call.
+    """
+    # If heuristic score is very high or very low, we might skip LLM to save costs
+    skip_llm = heuristic_score > 0.85 or heuristic_score < 0.15
+    return not skip_llm
+
+
+def _llm_request(prompt: str) -> Dict[str, Any]:
+    """
+    Chat completion arguments for an analysis prompt.
+    """
+    return {
+        "model": "gpt-3.5-turbo",
+        "messages": [
+            {"role": "system", "content": "You are a cybersecurity expert analyzing emails for phishing."},
+            {"role": "user", "content": prompt}
+        ],
+        "temperature": 0.2
+    }
+
+
+def _parse_llm_response(content: str) -> Optional[Dict[str, Any]]:
+    """
+    Parse the JSON object from an LLM response, or return None if there is none.
+    """
+    llm_result = None
+    
+    # Try to parse JSON from the LLM response
+    try:
+        # Look for JSON pattern in the response
+        start_idx = content.find('{')
+        end_idx = content.rfind('}') + 1
+        
+        if start_idx >= 0 and end_idx > start_idx:
+            json_str = content[start_idx:end_idx]
+            llm_result = json_loads(json_str)
+    except Exception as e:
+        print(f"Error parsing LLM response: {e}")
     
+    return llm_result
+
+
+def _combine_results(relevant_knowledge: Dict[str, Any], heuristic_score: float, llm_result: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Build the analysis result from the heuristic score and the LLM result, if any.
+    """
     # Combine heuristic and LLM analysis if available, otherwise use heuristic only
     if llm_result:
         # Weighted average of heuristic and LLM scores
@@ -301,9 +595,13 @@ def analyze_message(self, message: Dict[str, Any]) -> Dict[str, Any]:
             brand = relevant_knowledge["brand_impersonation"]["name"]
             reasons.append(f"Potential {brand} brand impersonation detected")
         
+        # Only add tactics the reasons don't already mention
+        reasons_lc = [str(reason).lower() for reason in reasons]
         for tactic_name in relevant_knowledge["tactics"].keys():
-            if tactic_name not in str(reasons).lower():
-                reasons.append(f"{tactic_name.capitalize()} tactics detected in message")
+            if not any(tactic_name in reason_lc for reason_lc in reasons_lc):
+                reason = f"{tactic_name.capitalize()} tactics detected in message"
+                reasons.append(reason)
+                reasons_lc.append(reason.lower())
         
         return {
             "is_suspicious": final_is_suspicious,
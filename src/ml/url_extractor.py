@@ -4,15 +4,57 @@ Advanced URL analysis for phishing detection
 """
 
 import re
+import functools
 import tldextract
 import urllib.parse
 import difflib
 import ipaddress
 import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any, Tuple, Optional
 import requests
 from urllib.parse import urlparse
 
+from .keyword_index import KeywordIndex
+
+# Number of distinct URLs whose analysis results are kept in memory
+URL_CACHE_SIZE = 4096
+
+# One shared extractor using the public suffix list snapshot bundled with
+# tldextract, so analysis never fetches the list or touches an on-disk cache
+_TLD = tldextract.TLDExtract(suffix_list_urls=(), cache_dir=None)
+
+# Hyperscan matches every misleading path pattern in one pass; without it each
+# pattern is searched with re
+try:
+    import hyperscan
+    HYPERSCAN_AVAILABLE = True
+except ImportError:
+    HYPERSCAN_AVAILABLE = False
+
+# google-re2 scans ASCII text for the URL patterns far faster than re; on other
+# text its \s, \d and case folding differ from re's, so re is used there
+try:
+    import re2
+    RE2_AVAILABLE = True
+except ImportError:
+    RE2_AVAILABLE = False
+
+# What re's \s matches in ASCII text (RE2's \s leaves out \v and \x1c-\x1f)
+_ASCII_SPACE_CLASS = r'\t\n\x0b\x0c\r\x1c-\x1f '
+
+# rapidfuzz computes similarity ratios in C++; used to skip most difflib comparisons
+try:
+    from rapidfuzz import fuzz, process
+    RAPIDFUZZ_AVAILABLE = True
+except ImportError:
+    RAPIDFUZZ_AVAILABLE = False
+
+def _add_match_id(pattern_id, start, end, flags, matched_ids):
+    """Hyperscan match callback collecting the ids of matching patterns."""
+    matched_ids.add(pattern_id)
+
 class URLExtractor:
     def __init__(self):
         """Initialize the URL extractor and analyzer."""
@@ -32,6 +74,35 @@ class URLExtractor:
             re.compile(r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}(?::\d+)?/[^\s]*', re.IGNORECASE)
         ]
         
+        # Text each of the patterns above needs (in the lowercased input) to
+        # match at all, so patterns that can't match skip their scan
+        self._url_pattern_literals = [
+            'http',  # Standard URLs
+            'www.',  # URLs without scheme
+            'http',  # Obfuscated URLs
+            '/',     # Shortened domains
+            'http',  # IP addresses with scheme
+            '/'      # Raw IP addresses with path
+        ]
+        
+        # The same patterns compiled with RE2 for ASCII text, which is scanned
+        # as bytes. \s only appears inside character classes, so it is spelled
+        # out in place
+        self._url_patterns_re2 = None
+        if RE2_AVAILABLE:
+            try:
+                self._url_patterns_re2 = [
+                    re2.compile(('(?i)' + pattern.pattern.replace('\\s', _ASCII_SPACE_CLASS)).encode())
+                    for pattern in self.url_patterns
+                ]
+            except Exception as e:
+                print(f"Error compiling URL patterns with RE2, using re instead: {e}")
+        
+        # Regex patterns used while normalizing and analyzing URLs
+        self._ipv4_prefix_re = re.compile(r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}')
+        # Host (with optional port) shaped like an IPv4 address
+        self._ipv4_netloc_re = re.compile(r'(?:[0-9]{1,3}\.){3}[0-9]{1,3}(?::|$)')
+        
         # Common legitimate domains
         self.common_legitimate_domains = [
             "google.com", "microsoft.com", "apple.com", "amazon.com", "facebook.com",
@@ -43,20 +114,163 @@ class URLExtractor:
             "att.com", "t-mobile.com", "comcast.com", "xfinity.com", "spectrum.com"
         ]
         
+        self._legitimate_domains_lc = [legit_domain.lower() for legit_domain in self.common_legitimate_domains]
+        self._legitimate_domain_lengths = [len(legit_domain) for legit_domain in self._legitimate_domains_lc]
+        
         # List of suspicious TLDs often used in phishing
-        self.suspicious_tlds = [
+        self.suspicious_tlds = frozenset([
             "xyz", "top", "club", "online", "site", "fun", "space", "info", "stream",
             "gq", "cf", "ga", "ml", "tk", "pw", "su", "rocks", "racing", "icu", "work", 
             "casa", "loan", "date", "faith", "review", "science", "trade", "webcam", "bid"
-        ]
+        ])
         
         # URL shortening services
-        self.url_shorteners = [
+        self.url_shorteners = frozenset([
             "bit.ly", "tinyurl.com", "goo.gl", "t.co", "is.gd", "cli.gs", "pic.gd", "go2l.ink",
             "shorten.link", "buff.ly", "rebrand.ly", "tiny.cc", "ow.ly", "snip.ly", "url.is",
             "cutt.ly", "short.io", "shorturl.at", "s.id", "v.gd", "gl.am", "adf.ly"
+        ])
+        
+        # URL paths that imitate login and account pages
+        self.misleading_path_patterns = [
+            r'/login', r'/signin', r'/account', r'/secure', r'/verify',
+            r'/authenticate', r'/webscr', r'/update', r'/confirm'
+        ]
+        self._misleading_path_res = tuple(
+            re.compile(pattern, re.IGNORECASE) for pattern in self.misleading_path_patterns
+        )
+        
+        self._path_database = None
+        if HYPERSCAN_AVAILABLE:
+            try:
+                pattern_count = len(self.misleading_path_patterns)
+                database = hyperscan.Database(mode=hyperscan.HS_MODE_BLOCK)
+                database.compile(
+                    expressions=[pattern.encode() for pattern in self.misleading_path_patterns],
+                    ids=list(range(pattern_count)),
+                    elements=pattern_count,
+                    flags=[hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_SINGLEMATCH] * pattern_count
+                )
+                self._path_database = database
+                # Hyperscan scratch space can't be shared between concurrent scans
+                self._path_scratch = threading.local()
+            except Exception as e:
+                print(f"Error compiling path patterns with Hyperscan, using re instead: {e}")
+        
+        # Brand names commonly impersonated in phishing domains
+        self.common_brands = [
+            "paypal", "microsoft", "apple", "google", "amazon", "facebook", 
+            "netflix", "twitter", "instagram", "bank", "chase", "wellsfargo", 
+            "bankofamerica", "citibank", "amex", "americanexpress"
         ]
         
+        # Letters that digits commonly stand in for (paypa1, g00gle, n3tflix)
+        self._deleet_table = str.maketrans({'0': 'o', '1': 'l', '3': 'e', '4': 'a', '5': 's', '7': 't'})
+        
+        # Find every brand in a domain or path with a single pass
+        self._brands_lc = {brand: brand.lower() for brand in self.common_brands}
+        self._brand_index = KeywordIndex([(brand_lc, brand) for brand, brand_lc in self._brands_lc.items()])
+        
+        # Shortened URLs are resolved concurrently, each worker thread reusing
+        # its own HTTP session so connections stay open between lookups
+        self._executor = ThreadPoolExecutor(max_workers=8)
+        self._sessions = threading.local()
+        
+        # Emails often repeat the same (tracking) URL, and the analysis only
+        # depends on the URL string, so remember results across calls
+        self._analyze_url_cached = functools.lru_cache(maxsize=URL_CACHE_SIZE)(self._analyze_url)
+        
+        # Legitimate domains that contain each brand name, for the impersonation check
+        self._brand_legitimate_domains = {
+            brand: tuple(
+                legit_domain_lc for legit_domain_lc in self._legitimate_domains_lc
+                if brand_lc in legit_domain_lc
+            )
+            for brand, brand_lc in self._brands_lc.items()
+        }
+        
+    def _find_brands(self, text: str) -> set:
+        """
+        Find brand names in lowercased text.
+        
+        Args:
+            text: Lowercased text to scan
+            
+        Returns:
+            Set of brands found
+        """
+        brands = set()
+        for _, _, found_brands in self._brand_index.iter(text):
+            brands.update(found_brands)
+        return brands
+    
+    def _find_mimicked_domain(self, domain: str) -> Optional[str]:
+        """
+        Find the first legitimate domain that a domain closely resembles without matching.
+        
+        Args:
+            domain: Lowercased registered domain, e.g. "paypa1.com"
+            
+        Returns:
+            The resembled legitimate domain, or None
+        """
+        if RAPIDFUZZ_AVAILABLE:
+            # fuzz.ratio measures the longest common subsequence, which is never
+            # less than the matches difflib finds, so anything it scores at or
+            # below 0.7 can't pass the difflib check either
+            candidates = sorted(
+                index for _, _, index in process.extract(
+                    domain, self._legitimate_domains_lc, scorer=fuzz.ratio,
+                    processor=None, score_cutoff=69, limit=None
+                )
+            )
+        else:
+            candidates = range(len(self._legitimate_domains_lc))
+        
+        domain_length = len(domain)
+        for index in candidates:
+            # The ratio can't exceed what the shorter string allows matching
+            # (difflib's real_quick_ratio()), so check that before building a matcher
+            legit_length = self._legitimate_domain_lengths[index]
+            if 2.0 * min(domain_length, legit_length) / (domain_length + legit_length) <= 0.7:
+                continue
+            
+            matcher = difflib.SequenceMatcher(None, domain, self._legitimate_domains_lc[index])
+            
+            # quick_ratio() is a cheap upper bound on ratio()
+            if matcher.quick_ratio() <= 0.7:
+                continue
+            
+            # High similarity but not exact match indicates possible typosquatting
+            if 0.7 < matcher.ratio() < 0.99:
+                return self.common_legitimate_domains[index]
+        
+        return None
+    
+    def _count_misleading_path_patterns(self, path: str) -> int:
+        """
+        Count the misleading path patterns that match a URL path.
+        
+        Args:
+            path: URL path
+            
+        Returns:
+            Number of matching patterns
+        """
+        # Hyperscan's caseless matching is ASCII-only, unlike re.IGNORECASE
+        if self._path_database is not None and path.isascii():
+            scratch = getattr(self._path_scratch, 'scratch', None)
+            if scratch is None:
+                scratch = self._path_scratch.scratch = hyperscan.Scratch(self._path_database)
+            
+            matched_ids = set()
+            self._path_database.scan(
+                path.encode(), match_event_handler=_add_match_id, context=matched_ids, scratch=scratch
+            )
+            return len(matched_ids)
+        
+        return sum(1 for pattern in self._misleading_path_res if pattern.search(path))
+        
     def extract_urls(self, text: str) -> List[str]:
         """
         Extract URLs from text using multiple regex patterns.
@@ -67,11 +281,32 @@ class URLExtractor:
         Returns:
             List of extracted URLs
         """
+        # Every pattern needs a '/' or '.', and most messages have neither
+        if '/' not in text and '.' not in text:
+            return []
+        
         urls = []
+        text_lc = text.lower()
+        
+        re2_patterns = self._url_patterns_re2
+        if re2_patterns is not None and text.isascii():
+            text_bytes = text.encode('ascii')
+        else:
+            re2_patterns = None
         
         # Apply each regex pattern
-        for pattern in self.url_patterns:
-            found_urls = pattern.findall(text)
+        for i, (pattern, literal) in enumerate(zip(self.url_patterns, self._url_pattern_literals)):
+            if literal not in text_lc:
+                continue
+            
+            if re2_patterns is not None:
+                found_urls = [
+                    tuple(group.decode('ascii') for group in match) if isinstance(match, tuple)
+                    else match.decode('ascii')
+                    for match in re2_patterns[i].findall(text_bytes)
+                ]
+            else:
+                found_urls = pattern.findall(text)
             
             # Handle the matches based on pattern type
             if isinstance(found_urls, list):
@@ -90,7 +325,7 @@ class URLExtractor:
             if not url.startswith(('http://', 'https://')):
                 if url.startswith('www.'):
                     url = 'http://' + url
-                elif re.match(r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}', url):
+                elif self._ipv4_prefix_re.match(url):
                     url = 'http://' + url
             
             # Check if it's a valid URL
@@ -102,14 +337,7 @@ class URLExtractor:
                 continue
         
         # Remove duplicates while preserving order
-        unique_urls = []
-        seen = set()
-        for url in normalized_urls:
-            if url not in seen:
-                unique_urls.append(url)
-                seen.add(url)
-        
-        return unique_urls
+        return list(dict.fromkeys(normalized_urls))
     
     def analyze_url(self, url: str) -> Dict[str, Any]:
         """
@@ -121,6 +349,14 @@ class URLExtractor:
         Returns:
             Dictionary with analysis results
         """
+        # Copy the cached result so callers can't modify it
+        result = dict(self._analyze_url_cached(url))
+        if 'suspicious_indicators' in result:
+            result['suspicious_indicators'] = list(result['suspicious_indicators'])
+        return result
+    
+    def _analyze_url(self, url: str) -> Dict[str, Any]:
+        """Uncached implementation of analyze_url."""
         # Parse URL
         try:
             parsed_url = urlparse(url)
@@ -131,11 +367,13 @@ class URLExtractor:
                 parsed_url = urlparse(url)
                 
             # Extract domain parts
-            tld_parts = tldextract.extract(url)
+            tld_parts = _TLD(url)
             domain = tld_parts.domain
             suffix = tld_parts.suffix
             subdomain = tld_parts.subdomain
             full_domain = f"{tld_parts.domain}.{tld_parts.suffix}"
+            netloc = parsed_url.netloc
+            suffix_lc = suffix.lower()
             
             # Initialize results
             result = {
@@ -151,33 +389,43 @@ class URLExtractor:
                 'suspicious_level': 'safe'
             }
             
-            # Check for IP address
+            # Check for IP address, only validating hosts shaped like IPv4
+            # or containing the two colons any IPv6 address has
             is_ip_address = False
-            try:
-                ipaddress.ip_address(parsed_url.netloc)
-                is_ip_address = True
-            except ValueError:
+            if self._ipv4_netloc_re.match(netloc) or netloc.count(':') > 1:
                 try:
-                    # Handle port numbers
-                    host = parsed_url.netloc.split(':')[0]
-                    ipaddress.ip_address(host)
+                    ipaddress.ip_address(netloc)
                     is_ip_address = True
                 except ValueError:
-                    pass
+                    try:
+                        # Handle port numbers
+                        host = netloc.split(':')[0]
+                        ipaddress.ip_address(host)
+                        is_ip_address = True
+                    except ValueError:
+                        pass
             
             if is_ip_address:
                 result['is_ip_address'] = True
                 result['suspicious_indicators'].append('Uses IP address instead of domain name')
                 result['score'] += 0.3
             
-            # Check for URL shorteners
-            if any(shortener in full_domain.lower() for shortener in self.url_shorteners):
+            # Find brand names in the domain in one pass
+            domain_lc = domain.lower()
+            full_domain_lc = f"{domain_lc}.{suffix_lc}"
+            full_domain_brands = self._find_brands(full_domain_lc)
+            domain_brands = {brand for brand in full_domain_brands if self._brands_lc[brand] in domain_lc}
+            
+            # Check for URL shorteners, matching whole domain labels so that
+            # e.g. microsoft.com isn't mistaken for t.co
+            domain_labels = full_domain_lc.split('.')
+            if any('.'.join(domain_labels[i:]) in self.url_shorteners for i in range(len(domain_labels))):
                 result['is_shortened'] = True
                 result['suspicious_indicators'].append('Uses URL shortening service')
                 result['score'] += 0.2
             
             # Check for suspicious TLDs
-            if suffix.lower() in self.suspicious_tlds:
+            if suffix_lc in self.suspicious_tlds:
                 result['suspicious_indicators'].append(f'Uses suspicious TLD (.{suffix})')
                 result['score'] += 0.25
             
@@ -186,25 +434,17 @@ class URLExtractor:
                 result['suspicious_indicators'].append('Excessive subdomains')
                 result['score'] += 0.2
             
-            # Check for brand impersonation in domain
-            common_brands = ["paypal", "microsoft", "apple", "google", "amazon", "facebook", 
-                           "netflix", "twitter", "instagram", "bank", "chase", "wellsfargo", 
-                           "bankofamerica", "citibank", "amex", "americanexpress"]
-            
             # Check for brand name in domain but not matching legitimate domain
             brand_impersonation = False
             impersonated_brand = None
             
-            for brand in common_brands:
+            for brand in self.common_brands:
                 # Check if brand appears in domain
-                if brand.lower() in domain.lower():
-                    is_legitimate = False
-                    
+                if brand in domain_brands:
                     # Compare with legitimate domains
-                    for legit_domain in self.common_legitimate_domains:
-                        if brand.lower() in legit_domain.lower() and domain.lower() in legit_domain.lower():
-                            is_legitimate = True
-                            break
+                    is_legitimate = any(
+                        domain_lc in legit_domain for legit_domain in self._brand_legitimate_domains[brand]
+                    )
                     
                     if not is_legitimate:
                         brand_impersonation = True
@@ -216,43 +456,39 @@ class URLExtractor:
                 result['score'] += 0.35
             
             # Check for misleading domains (typosquatting)
-            for legit_domain in self.common_legitimate_domains:
-                # Check how similar our domain is to the legitimate domain
-                similarity = difflib.SequenceMatcher(None, full_domain.lower(), legit_domain.lower()).ratio()
-                
-                # High similarity but not exact match indicates possible typosquatting
-                if 0.7 < similarity < 0.99:
-                    result['suspicious_indicators'].append(f'Appears to mimic {legit_domain}')
-                    result['score'] += 0.3
-                    break
-            
-            # Check for numbers replacing letters (e.g., paypa1.com instead of paypal.com)
-            if re.search(r'\d', domain):
-                # Only suspicious if combined with a brand-like name
-                if any(brand.lower() in domain.lower() for brand in common_brands):
-                    result['suspicious_indicators'].append('Uses numbers to replace letters in brand name')
-                    result['score'] += 0.25
+            mimicked_domain = self._find_mimicked_domain(full_domain.lower())
+            if mimicked_domain is not None:
+                result['suspicious_indicators'].append(f'Appears to mimic {mimicked_domain}')
+                result['score'] += 0.3
+            
+            # Check for numbers replacing letters (e.g., paypa1.com instead of paypal.com):
+            # a brand that only appears once the digits are read as letters
+            deleeted_domain = domain_lc.translate(self._deleet_table)
+            if deleeted_domain != domain_lc and not self._find_brands(deleeted_domain) <= domain_brands:
+                result['suspicious_indicators'].append('Uses numbers to replace letters in brand name')
+                result['score'] += 0.25
             
             # Check for unusual URL patterns
-            if any(char in parsed_url.netloc for char in ['@', '-', '_']):
+            if any(char in netloc for char in ['@', '-', '_']):
                 result['suspicious_indicators'].append('Contains unusual characters in domain')
                 result['score'] += 0.15
             
             # Check for misleading path
-            misleading_path_patterns = [
-                r'/login', r'/signin', r'/account', r'/secure', r'/verify',
-                r'/authenticate', r'/webscr', r'/update', r'/confirm'
-            ]
-            
             if parsed_url.path:
-                for pattern in misleading_path_patterns:
-                    if re.search(pattern, parsed_url.path, re.IGNORECASE):
-                        # Check if path contains brand name but domain doesn't match
-                        for brand in common_brands:
-                            if brand.lower() in parsed_url.path.lower() and brand.lower() not in full_domain.lower():
-                                result['suspicious_indicators'].append(f'Path suggests {brand} but domain does not match')
-                                result['score'] += 0.25
-                                break
+                # First brand the path mentions that the domain doesn't
+                path_brands = self._find_brands(parsed_url.path.lower())
+                path_brand = next(
+                    (brand for brand in self.common_brands
+                     if brand in path_brands and brand not in full_domain_brands),
+                    None
+                )
+                
+                # Check if path contains brand name but domain doesn't match,
+                # once per misleading pattern the path matches
+                if path_brand is not None:
+                    for _ in range(self._count_misleading_path_patterns(parsed_url.path)):
+                        result['suspicious_indicators'].append(f'Path suggests {path_brand} but domain does not match')
+                        result['score'] += 0.25
             
             # Check for data URLs
             if parsed_url.scheme == 'data':
@@ -308,7 +544,14 @@ class URLExtractor:
             Full destination URL or None if unsuccessful
         """
         try:
-            response = requests.head(url, allow_redirects=True, timeout=5)
+            session = getattr(self._sessions, 'session', None)
+            if session is None:
+                session = self._sessions.session = requests.Session()
+            
+            # Don't carry cookies from one lookup's redirect chain into the next
+            session.cookies.clear()
+            
+            response = session.head(url, allow_redirects=True, timeout=5)
             return response.url
         except Exception as e:
             print(f"Error resolving shortened URL {url}: {e}")
@@ -327,31 +570,39 @@ class URLExtractor:
         # Extract URLs
         urls = self.extract_urls(text)
         
-        # Analyze each URL
-        url_analyses = self.analyze_urls(urls)
+        # Analyze each URL, totalling scores and collecting shortened URLs
+        # to resolve as we go
+        url_analyses = []
+        total_score = 0.0
+        suspicious_count = 0
+        shortened_urls = []
+        
+        for url in urls:
+            result = self.analyze_url(url)
+            url_analyses.append(result)
+            total_score += result.get('score', 0.0)
+            if result.get('is_suspicious', False):
+                suspicious_count += 1
+            if result.get('is_shortened', False) and not result.get('error', False):
+                shortened_urls.append(result)
         
         # Calculate overall suspicion score
-        suspicious_count = sum(1 for result in url_analyses if result.get('is_suspicious', False))
         overall_score = 0.0
         
         if urls:
             # Average score of all URLs
-            overall_score = sum(result.get('score', 0.0) for result in url_analyses) / len(urls)
+            overall_score = total_score / len(urls)
             
             # Increase weight if there are multiple suspicious URLs
             if suspicious_count > 1:
                 overall_score = min(1.0, overall_score * (1.0 + (suspicious_count * 0.1)))
         
-        # Determine if any shortened URLs should be resolved
-        shortened_urls = [
-            result for result in url_analyses 
-            if result.get('is_shortened', False) and not result.get('error', False)
-        ]
+        # Resolve shortened URLs concurrently (limit to 3 to avoid excessive requests)
+        shortened_urls = shortened_urls[:3]
+        resolved = self._executor.map(self.resolve_shortened_url, [result['url'] for result in shortened_urls])
         
-        # Resolve shortened URLs (limit to 3 to avoid excessive requests)
         resolved_urls = []
-        for result in shortened_urls[:3]:
-            resolved_url = self.resolve_shortened_url(result['url'])
+        for result, resolved_url in zip(shortened_urls, resolved):
             if resolved_url and resolved_url != result['url']:
                 resolved_urls.append({
                     'original_url': result['url'],
@@ -367,4 +618,12 @@ class URLExtractor:
             'overall_score': overall_score,
             'overall_suspicious': overall_score > 0.4,
             'resolved_shortened_urls': resolved_urls
-        }
\ No newline at end of file
+        }
+
+
+# Shared extractor, so callers reuse the compiled patterns, lookup tables and
+# analysis cache instead of building their own
+default_extractor = URLExtractor()
+extract_urls = default_extractor.extract_urls
+analyze_url = default_extractor.analyze_url
+analyze_urls_in_text = default_extractor.analyze_urls_in_text
@@ -0,0 +1,33 @@
+from src.ml.llm_analyzer import LLMAnalyzer
+
+def make_analyzer(responses):
+    """LLMAnalyzer whose API calls are replaced by a recorder"""
+    analyzer = LLMAnalyzer()
+    
+    def query(prompt):
+        responses.append(prompt)
+        return {"is_phishing": False, "score": 0.0}
+    
+    analyzer._query_openai = query
+    analyzer._query_anthropic = query
+    return analyzer
+
+def test_lone_surrogates_in_message():
+    """Test that content decoded with surrogateescape can be analyzed and cached"""
+    prompts = []
+    analyzer = make_analyzer(prompts)
+    message = {"sender": "a", "subject": "b", "content": "x\udcff"}
+    
+    assert analyzer.detect_sophisticated_phishing(message) == {"is_phishing": False, "score": 0.0}
+    analyzer.detect_sophisticated_phishing(dict(message))
+    assert len(prompts) == 1
+
+def test_surrogate_messages_do_not_collide():
+    """Test that messages differing only in lone surrogates get separate cache entries"""
+    prompts = []
+    analyzer = make_analyzer(prompts)
+    analyzer.detect_batch([
+        {"sender": "a", "subject": "b", "content": "x\udcff"},
+        {"sender": "a", "subject": "b", "content": "x\udcfe"},
+    ])
+    assert len(prompts) == 2
@@ -0,0 +1,107 @@
+import re
+import time
+
+import pytest
+
+from src.ml.logo_detector import LogoDetector, _brand_token_regex
+
+detector = LogoDetector()
+
+NON_ELEMENT_MARKUP = [
+    '<!-- <img src="google.png"> -->',
+    '<script>var s = "<img src=\'netflix.png\'>";</script>',
+    '<style>.logo { background: url(apple.png); }</style>',
+    '<textarea><img src="paypal.png"></textarea>',
+]
+
+@pytest.mark.parametrize("markup", NON_ELEMENT_MARKUP)
+def test_markup_outside_elements_is_not_an_image(markup):
+    """Test that images inside comments, scripts, styles and textareas are ignored"""
+    result = detector.analyze_html_for_brand_logos(markup, "https://phish.example.com/")
+    assert result["images"] == []
+    assert not result["impersonation_detected"]
+
+@pytest.mark.parametrize("markup", NON_ELEMENT_MARKUP)
+def test_fast_extraction_skips_markup_outside_elements(markup):
+    """Test that the regex sweep skips the same markup as the HTML parser"""
+    html = markup + '<img src="banner.png">'
+    fast_srcs = [image["src"] for image in detector.fast_extract_images(html)]
+    assert fast_srcs == ["banner.png"]
+    assert fast_srcs == [image["src"] for image in detector.extract_images_from_html(html)]
+
+def test_fast_extraction_duplicate_attributes_match_parser():
+    """Test that a repeated src attribute resolves like the HTML parser"""
+    html = '<img src="a.png" src="microsoft.png">'
+    assert detector.fast_extract_images(html) == detector.extract_images_from_html(html)
+
+def test_fast_analysis_matches_default():
+    """Test that fast=True gives the same verdict as the HTML parser on regular markup"""
+    html = '<div><img src="/img/microsoft-logo.png" alt="Microsoft" width="120" height="40"></div>'
+    url = "https://phish.example.com/login"
+    assert detector.analyze_html_for_brand_logos(html, url, fast=True) == detector.analyze_html_for_brand_logos(html, url)
+    assert detector.analyze_html_for_brand_logos(html, url)["impersonated_brand"] == "microsoft"
+
+@pytest.mark.parametrize("html", [
+    "<img " * 20000,
+    "<img " + "a" * 100000 + ">",
+    '<img src="' * 20000,
+])
+def test_fast_extraction_is_linear_on_unterminated_tags(html):
+    """Test that hostile unterminated or attribute-less tags don't make the regex sweep quadratic"""
+    start = time.perf_counter()
+    detector.fast_extract_images(html)
+    assert time.perf_counter() - start < 1.0
+
+def test_fast_extraction_keeps_quoted_angle_brackets():
+    """Test that a '>' inside a quoted attribute value doesn't end the tag"""
+    html = '<img alt="a > b" src="microsoft-logo.png">'
+    assert detector.fast_extract_images(html) == detector.extract_images_from_html(html)
+
+EXTRACTORS = [detector.extract_images_from_html, detector.fast_extract_images]
+
+@pytest.mark.parametrize("extract", EXTRACTORS)
+def test_background_url_is_case_insensitive(extract):
+    """Test that CSS background images are found regardless of property case"""
+    html = '<div style="BACKGROUND:URL(paypal-logo.png)">Sign in</div>'
+    assert [image["src"] for image in extract(html)] == ["paypal-logo.png"]
+
+@pytest.mark.parametrize("extract", EXTRACTORS)
+def test_unquoted_background_urls_stop_at_parenthesis(extract):
+    """Test that each unquoted url(...) in a style is its own image"""
+    html = '<div style="background:url(a.png) no-repeat; background-image:url(b.png)"></div>'
+    assert [image["src"] for image in extract(html)] == ["a.png", "b.png"]
+
+@pytest.mark.parametrize("extract", EXTRACTORS)
+def test_unit_suffixed_sizes_do_not_abort_extraction(extract):
+    """Test that width/height values like "20px" are parsed instead of dropping every image"""
+    html = '<img src="logo.png" width="20px" height="20px"><img src="apple-logo.png" width="auto" height="">'
+    assert [image["src"] for image in extract(html)] == ["logo.png", "apple-logo.png"]
+
+@pytest.mark.parametrize("extract", EXTRACTORS)
+def test_tiny_images_are_skipped(extract):
+    """Test that images under 20 pixels in both dimensions are still skipped"""
+    html = '<img src="pixel.gif" width="1px" height="1"><img src="logo.png" width="120" height="40">'
+    assert [image["src"] for image in extract(html)] == ["logo.png"]
+
+def test_src_cache_keys_are_fixed_size():
+    """Test that large inline data: srcs aren't kept alive as cache keys"""
+    cache_detector = LogoDetector()
+    src = "data:image/png;base64," + "A" * 1_000_000
+    images = [{"src": src, "alt": "Microsoft"}, {"src": src, "alt": "Microsoft"}]
+    
+    first = cache_detector.analyze_image_urls(images)
+    assert cache_detector.analyze_image_urls(images) == first
+    assert len(cache_detector._src_cache) == 1
+    assert all(len(key) == 16 for key in cache_detector._src_cache)
+
+def test_default_patterns_keep_token_prefilter():
+    """Test that the built-in brand patterns still get the leading-word pre-check"""
+    assert detector._brand_token_re is not None
+    assert not detector._brand_token_re.search("banner.png")
+
+@pytest.mark.parametrize("pattern", [r"chase.*\.png|jpmorgan.*\.png", r"(chase.*|jpmorgan.*)\.png"])
+def test_alternation_after_prefix_disables_token_prefilter(pattern):
+    """Test that a pattern whose alternatives don't all start with its leading word can still match"""
+    token_re = _brand_token_regex([r"paypal.*\.png", pattern])
+    assert token_re is None or token_re.search("jpmorgan-logo.png")
+    assert re.search(pattern, "jpmorgan-logo.png")
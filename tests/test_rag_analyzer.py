@@ -0,0 +1,67 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+import src.ml.knowledge_base as knowledge_base
+
+class FakeKnowledgeBase:
+    def __init__(self):
+        self.knowledge = {"tactics": {}, "brand_impersonation": {}, "common_phishing_patterns": {}}
+
+    def get_all_tactics(self):
+        return self.knowledge["tactics"]
+
+# rag_analyzer imports a PhishingKnowledgeBase that knowledge_base doesn't define
+knowledge_base.PhishingKnowledgeBase = FakeKnowledgeBase
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+from src.ml import rag_analyzer
+
+MESSAGE = {"sender": "support@example.com", "subject": "Your account", "content": "Please review your account details."}
+LLM_ANSWER = {"is_suspicious": True, "confidence": 0.9, "reasons": ["LLM reason"], "tactics_used": [], "impersonated_brand": None}
+
+class FlakyCompletions:
+    """Chat completions that fail on the first call and answer afterwards."""
+    def __init__(self):
+        self.calls = 0
+
+    def _respond(self):
+        self.calls += 1
+        if self.calls == 1:
+            raise RuntimeError("service unavailable")
+        message = type("Message", (), {"content": json.dumps(LLM_ANSWER)})
+        choice = type("Choice", (), {"message": message})
+        return type("Response", (), {"choices": [choice]})
+
+    def create(self, **kwargs):
+        return self._respond()
+
+class AsyncFlakyCompletions(FlakyCompletions):
+    async def create(self, **kwargs):
+        return self._respond()
+
+def flaky_client(completions):
+    return type("Client", (), {"chat": type("Chat", (), {"completions": completions})})
+
+@pytest.fixture
+def analyzer(monkeypatch):
+    monkeypatch.setattr(rag_analyzer, "_needs_llm", lambda heuristic_score: True)
+    return rag_analyzer.RAGPhishingAnalyzer()
+
+def test_failed_llm_call_is_not_cached(analyzer):
+    """Test that a heuristic-only fallback after an LLM error is retried instead of cached"""
+    analyzer.client = flaky_client(FlakyCompletions())
+    assert "LLM reason" not in analyzer.analyze_message(MESSAGE)["reasons"]
+    assert "LLM reason" in analyzer.analyze_message(MESSAGE)["reasons"]
+    assert "LLM reason" in analyzer.analyze_message(MESSAGE)["reasons"]
+    assert analyzer.client.chat.completions.calls == 2
+
+def test_failed_async_llm_call_is_not_cached(analyzer):
+    """Test that the batch path also retries messages whose LLM call failed"""
+    analyzer.aclient = flaky_client(AsyncFlakyCompletions())
+    assert "LLM reason" not in asyncio.run(analyzer.analyze_messages([MESSAGE]))[0]["reasons"]
+    assert "LLM reason" in asyncio.run(analyzer.analyze_messages([MESSAGE]))[0]["reasons"]
+    assert "LLM reason" in asyncio.run(analyzer.analyze_messages([MESSAGE]))[0]["reasons"]
+    assert analyzer.aclient.chat.completions.calls == 2
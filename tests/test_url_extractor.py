@@ -0,0 +1,48 @@
+import pytest
+
+from src.ml.url_extractor import URLExtractor
+
+extractor = URLExtractor()
+
+DIGIT_SUBSTITUTION = "Uses numbers to replace letters in brand name"
+
+@pytest.mark.parametrize("url", [
+    "https://paypa1.com/signin",
+    "http://g00gle.com",
+    "https://faceb00k.com",
+    "http://n3tflix.xyz/account",
+])
+def test_digit_substituted_brand_is_flagged(url):
+    """Test that digits standing in for a brand's letters are reported"""
+    result = extractor.analyze_url(url)
+    assert DIGIT_SUBSTITUTION in result["suspicious_indicators"]
+
+@pytest.mark.parametrize("url", [
+    "http://paypal2024.com",
+    "https://example1.com",
+    "https://www.paypal.com",
+])
+def test_digits_without_substitution_are_not_flagged(url):
+    """Test that digits alongside (or without) a brand name aren't reported as substitution"""
+    result = extractor.analyze_url(url)
+    assert DIGIT_SUBSTITUTION not in result["suspicious_indicators"]
+
+@pytest.mark.parametrize("url", [
+    "https://microsoft.com/account",
+    "https://www.microsoft.com/",
+    "https://accounts.google.com/signin",
+])
+def test_domain_containing_shortener_text_is_not_shortened(url):
+    """Test that shortener domains only match whole domain labels (t.co is not in microsoft.com)"""
+    result = extractor.analyze_url(url)
+    assert not result["is_shortened"]
+    assert "Uses URL shortening service" not in result["suspicious_indicators"]
+
+@pytest.mark.parametrize("url", [
+    "https://t.co/abc123",
+    "https://bit.ly/x9Yz",
+    "http://www.tinyurl.com/abc",
+])
+def test_shortener_domains_are_shortened(url):
+    """Test that URL shortener domains are still detected"""
+    assert extractor.analyze_url(url)["is_shortened"]